@@ -7,10 +7,12 @@ First-time:    python app.py --setup
 import os
 import sys
 import csv
-import io
 import logging
 import argparse
+import hmac
 import secrets
+import threading
+import time
 from functools import wraps
 from datetime import datetime, timedelta
 
@@ -18,16 +20,23 @@ from flask import (
     Flask, render_template, redirect, url_for,
     request, session, jsonify, Response, flash, make_response,
 )
+from flask.json.provider import DefaultJSONProvider
+from flask.sessions import SecureCookieSessionInterface
 from flask_socketio import SocketIO, emit
 import bcrypt
-from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
 
 from config import (
-    SECRET_KEY, TOKEN_MAX_AGE, LOG_PATH,
+    SECRET_KEY, BCRYPT_COST, LOG_PATH,
     RESULTS_DISPLAY_SECONDS, ERROR_DISPLAY_SECONDS,
-    BASE_DIR,
+    VOTE_UPDATE_INTERVAL, ADMIN_PAGE_SIZE, BASE_DIR,
 )
 import database as db
+from tokens import verify_token
+
+try:
+    from sheets_sync import sync_to_sheets, sync_to_sheets_blocking
+except ImportError:
+    sync_to_sheets = sync_to_sheets_blocking = None
 
 
 # ── Logging ───────────────────────────────────────────────────────────────────
@@ -43,18 +52,60 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Optional C-backed JSON encoder; falls back to the stdlib via Flask's default
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+    logger.warning("orjson not installed — using the stdlib JSON encoder")
+
 
 # ── App + SocketIO ────────────────────────────────────────────────────────────
 
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson. Formatting kwargs are ignored."""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
+class AdminSessionInterface(SecureCookieSessionInterface):
+    """
+    Only the admin panel uses the session cookie. Kiosk and Socket.IO
+    requests get Flask's read-only null session, so the cookie is neither
+    verified on the way in nor re-signed on the way out.
+    """
+
+    def open_session(self, app, request):
+        if not request.path.startswith('/admin'):
+            return self.make_null_session(app)
+        return super().open_session(app, request)
+
+
 app = Flask(__name__)
 app.secret_key = SECRET_KEY
+app.session_interface = AdminSessionInterface()
+if ORJSON_AVAILABLE:
+    app.json = OrjsonProvider(app)
 
-# threading mode is mandatory — eventlet/gevent break I2C/GPIO drivers
-socketio = SocketIO(app, async_mode='threading', cors_allowed_origins='*')
+# threading mode is mandatory — eventlet/gevent break I2C/GPIO drivers.
+# The provider doubles as Socket.IO's json module (it only needs dumps/loads).
+socketio = SocketIO(app, async_mode='threading', cors_allowed_origins='*', json=app.json)
 
 
 # ── Helpers ───────────────────────────────────────────────────────────────────
 
+# Compared against when no admin password is provisioned, so a failed login
+# still costs a bcrypt round. It uses BCRYPT_COST, the cost run_setup hashes
+# with now; hashes stored by older versions (cost 12) take longer until the
+# password is reset with --setup.
+_DUMMY_HASH = bcrypt.hashpw(b'x', bcrypt.gensalt(BCRYPT_COST))
+
+
 def require_admin(f):
     @wraps(f)
     def decorated(*args, **kwargs):
@@ -64,39 +115,64 @@ def require_admin(f):
     return decorated
 
 
-def make_token(data):
-    return URLSafeTimedSerializer(SECRET_KEY).dumps(data)
-
-
-def verify_token(token):
-    try:
-        return URLSafeTimedSerializer(SECRET_KEY).loads(token, max_age=TOKEN_MAX_AGE)
-    except (BadSignature, SignatureExpired):
-        return None
-
-
 def db_time_to_html(dt_str):
     """'2025-09-15 09:00:00'  →  '2025-09-15T09:00'  for datetime-local inputs."""
     if not dt_str:
         return ''
-    return dt_str[:16].replace(' ', 'T')
+    return dt_str[:10] + 'T' + dt_str[11:16]
 
 
 def html_time_to_db(dt_str):
     """'2025-09-15T09:00'  →  '2025-09-15 09:00:00'  for SQLite storage."""
     if not dt_str:
         return ''
-    return dt_str.replace('T', ' ') + ':00'
+    return dt_str[:10] + ' ' + dt_str[11:] + ':00'
+
+
+class _Echo:
+    """File-like sink for csv.writer: writerow() returns the formatted line."""
+    def write(self, value):
+        return value
 
 
 def _build_options(vsession):
-    """Return list of (key, label) tuples for a session row."""
-    options = [('A', vsession['option_a']), ('B', vsession['option_b'])]
-    if vsession.get('option_c'):
-        options.append(('C', vsession['option_c']))
-    if vsession.get('option_d'):
-        options.append(('D', vsession['option_d']))
-    return options
+    """Return the (key, label) tuples precomputed by db.add_session_options."""
+    return vsession['_options']
+
+
+# vote_update coalescing: at most one broadcast per session per interval; a
+# burst inside the window is folded into one trailing emit of the final total.
+_last_emit    = {}     # session_id → time.monotonic() of the last broadcast
+_emit_pending = set()  # session_ids with a trailing broadcast scheduled
+_emit_lock    = threading.Lock()
+
+
+def _emit_vote_update(session_id):
+    with _emit_lock:
+        if session_id in _emit_pending:
+            return
+        wait = _last_emit.get(session_id, 0.0) + VOTE_UPDATE_INTERVAL - time.monotonic()
+        if wait > 0:
+            _emit_pending.add(session_id)
+        else:
+            _last_emit[session_id] = time.monotonic()
+    if wait > 0:
+        socketio.start_background_task(_emit_vote_update_later, session_id, wait)
+    else:
+        _send_vote_update(session_id)
+
+
+def _emit_vote_update_later(session_id, delay):
+    socketio.sleep(delay)
+    with _emit_lock:
+        _emit_pending.discard(session_id)
+        _last_emit[session_id] = time.monotonic()
+    _send_vote_update(session_id)
+
+
+def _send_vote_update(session_id):
+    total = db.get_total_votes(session_id)
+    socketio.emit('vote_update', {'session_id': session_id, 'total': total}, namespace='/kiosk')
 
 
 # ── Public / Kiosk routes ─────────────────────────────────────────────────────
@@ -155,8 +231,7 @@ def submit_vote():
     if not vsession:
         return redirect(url_for('error_page', msg='session_not_found'))
 
-    valid_options = [k for k, _ in _build_options(vsession)]
-    if chosen_option not in valid_options:
+    if chosen_option not in vsession['_option_keys']:
         return redirect(url_for('error_page', msg='invalid_option'))
 
     # Atomic duplicate-safe vote record
@@ -164,13 +239,11 @@ def submit_vote():
         return redirect(url_for('error_page', msg='already_voted'))
 
     # Fire-and-forget Sheets sync
-    if db.get_setting('sheets_enabled') == '1':
-        from sheets_sync import sync_to_sheets
+    if sync_to_sheets and db.get_setting('sheets_enabled') == '1':
         sync_to_sheets(session_id)
 
     # Notify any open result views
-    total = db.get_total_votes(session_id)
-    socketio.emit('vote_update', {'session_id': session_id, 'total': total}, namespace='/kiosk')
+    _emit_vote_update(session_id)
 
     return redirect(url_for('thankyou', session_id=session_id))
 
@@ -192,29 +265,36 @@ def closed():
     return render_template('closed.html')
 
 
+_ERROR_MESSAGES = {
+    'token_expired':     'Your session has expired. Please tap your card again.',
+    'already_voted':     'You have already voted this week!',
+    'session_changed':   'The voting session changed. Please tap your card again.',
+    'invalid_request':   'Invalid request. Please try again.',
+    'session_not_found': 'Voting session not found.',
+    'invalid_option':    'Invalid option selected.',
+    'unknown_error':     'An unexpected error occurred.',
+}
+_error_html = {}  # msg key → rendered error.html bytes; the page is static per key
+
+
 @app.route('/error')
 def error_page():
     msg = request.args.get('msg', 'unknown_error')
-    messages = {
-        'token_expired':     'Your session has expired. Please tap your card again.',
-        'already_voted':     'You have already voted this week!',
-        'session_changed':   'The voting session changed. Please tap your card again.',
-        'invalid_request':   'Invalid request. Please try again.',
-        'session_not_found': 'Voting session not found.',
-        'invalid_option':    'Invalid option selected.',
-        'unknown_error':     'An unexpected error occurred.',
-    }
-    return render_template(
-        'error.html',
-        message=messages.get(msg, messages['unknown_error']),
-        error_display_seconds=ERROR_DISPLAY_SECONDS,
-    )
+    if msg not in _ERROR_MESSAGES:
+        msg = 'unknown_error'
+    html = _error_html.get(msg)
+    if html is None:
+        html = _error_html[msg] = render_template(
+            'error.html',
+            message=_ERROR_MESSAGES[msg],
+            error_display_seconds=ERROR_DISPLAY_SECONDS,
+        ).encode()
+    return Response(html, mimetype='text/html')
 
 
 @app.route('/results-data/<int:session_id>')
 def results_data(session_id):
-    counts = db.get_vote_counts(session_id)
-    total  = sum(v['count'] for v in counts.values())
+    counts, total = db.get_vote_counts_with_total(session_id)
     return jsonify({'counts': counts, 'total': total})
 
 # ─────────────────────────────────────────────────────────────
@@ -223,13 +303,13 @@ def results_data(session_id):
 # ─────────────────────────────────────────────────────────────
 @app.route('/dev-vote')
 def dev_vote():
-    fake_session = {
+    fake_session = db.add_session_options({
         'question': 'Which mascot should our school choose?',
         'option_a': 'Freddie',
         'option_b': 'Almie',
         'option_c': 'Hammie',
         'option_d': 'Dunno',
-    }
+    })
 
     return render_template(
         'vote.html',
@@ -244,8 +324,15 @@ def dev_vote():
 def admin_login():
     if request.method == 'POST':
         password = request.form.get('password', '')
+        # Read on every login so a password reset with --setup (a separate
+        # process) takes effect without restarting the server
         hash_    = db.get_admin_password_hash()
-        if hash_ and bcrypt.checkpw(password.encode(), hash_.encode()):
+        hash_    = hash_.encode() if hash_ else None
+        # Always run bcrypt and combine with & (not `and`) so the response
+        # time doesn't reveal whether an admin password has been set.
+        ok = bcrypt.checkpw(password.encode(), hash_ or _DUMMY_HASH)
+        ok = ok & bool(hash_)
+        if hmac.compare_digest(b'1' if ok else b'0', b'1'):
             session['admin_logged_in'] = True
             return redirect(url_for('admin_dashboard'))
         flash('Incorrect password.', 'error')
@@ -265,14 +352,11 @@ def admin_logout():
 @require_admin
 def admin_dashboard():
     active      = db.get_active_session()
-    all_sessions = db.get_all_sessions()
-    cards       = db.get_all_cards()
-    total_cards = sum(1 for c in cards if c['is_active'])
+    total_cards = db.count_active_cards()
     votes_today = db.get_total_votes(active['id']) if active else 0
     return render_template(
         'admin/dashboard.html',
         active_session=active,
-        sessions=all_sessions,
         total_cards=total_cards,
         votes_today=votes_today,
     )
@@ -283,7 +367,14 @@ def admin_dashboard():
 @app.route('/admin/sessions')
 @require_admin
 def admin_sessions():
-    return render_template('admin/sessions.html', sessions=db.get_all_sessions())
+    page     = max(request.args.get('page', 1, type=int), 1)
+    sessions = db.get_all_sessions(ADMIN_PAGE_SIZE + 1, (page - 1) * ADMIN_PAGE_SIZE)
+    return render_template(
+        'admin/sessions.html',
+        sessions=sessions[:ADMIN_PAGE_SIZE],
+        page=page,
+        has_next=len(sessions) > ADMIN_PAGE_SIZE,
+    )
 
 
 @app.route('/admin/sessions/new', methods=['GET', 'POST'])
@@ -369,7 +460,12 @@ def admin_sessions_reset_votes(session_id):
 @app.route('/admin/cards')
 @require_admin
 def admin_cards():
-    return render_template('admin/cards.html', cards=db.get_all_cards())
+    show_inactive = request.args.get('inactive') == '1'
+    return render_template(
+        'admin/cards.html',
+        cards=db.get_all_cards(show_inactive),
+        show_inactive=show_inactive,
+    )
 
 
 @app.route('/admin/cards/deactivate/<int:card_id>', methods=['POST'])
@@ -385,7 +481,7 @@ def admin_cards_deactivate(card_id):
 def admin_cards_reactivate(card_id):
     db.reactivate_card(card_id)
     flash('Card reactivated.', 'success')
-    return redirect(url_for('admin_cards'))
+    return redirect(url_for('admin_cards', inactive=1))
 
 
 @app.route('/admin/cards/delete/<int:card_id>', methods=['POST'])
@@ -398,10 +494,17 @@ def admin_cards_delete(card_id):
 
 # ── Admin — results ───────────────────────────────────────────────────────────
 
+def _session_choices(sessions, selected):
+    """The dropdown's sessions, plus the selected one if it's older than the list."""
+    if selected and all(s['id'] != selected['id'] for s in sessions):
+        return [*sessions, selected]
+    return sessions
+
+
 @app.route('/admin/results')
 @require_admin
 def admin_results():
-    all_sessions = db.get_all_sessions()
+    all_sessions = db.get_all_sessions(ADMIN_PAGE_SIZE)
     selected_id  = request.args.get('session_id', type=int)
     active       = db.get_active_session()
 
@@ -411,14 +514,14 @@ def admin_results():
         selected    = active
         selected_id = active['id']
     elif all_sessions:
-        selected    = all_sessions[0]
-        selected_id = selected['id']
+        selected_id = all_sessions[0]['id']
+        selected    = db.get_session(selected_id)
     else:
         selected = None
 
     return render_template(
         'admin/results.html',
-        sessions=all_sessions,
+        sessions=_session_choices(all_sessions, selected),
         selected=selected,
         selected_id=selected_id,
     )
@@ -429,14 +532,14 @@ def admin_results():
 @app.route('/admin/export')
 @require_admin
 def admin_export():
-    all_sessions = db.get_all_sessions()
+    all_sessions = db.get_all_sessions(ADMIN_PAGE_SIZE)
     selected_id  = request.args.get('session_id', type=int)
     if not selected_id and all_sessions:
         selected_id = all_sessions[0]['id']
     selected = db.get_session(selected_id) if selected_id else None
     return render_template(
         'admin/export.html',
-        sessions=all_sessions,
+        sessions=_session_choices(all_sessions, selected),
         selected=selected,
         selected_id=selected_id,
     )
@@ -446,7 +549,7 @@ def admin_export():
 @require_admin
 def admin_export_csv():
     session_id   = request.args.get('session_id', type=int)
-    all_sessions = db.get_all_sessions()
+    all_sessions = db.get_all_sessions(1)
 
     if not session_id and all_sessions:
         session_id = all_sessions[0]['id']
@@ -455,34 +558,31 @@ def admin_export_csv():
         return redirect(url_for('admin_export'))
 
     vsession = db.get_session(session_id)
-    votes    = db.get_all_votes_for_export(session_id)
-    counts   = db.get_vote_counts(session_id)
-    total    = sum(v['count'] for v in counts.values())
-
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(['Voting System Export'])
-    writer.writerow(['Question:', vsession['question']])
-    writer.writerow(['Session Start:', vsession['start_time']])
-    writer.writerow(['Session End:',   vsession['end_time']])
-    writer.writerow([])
-    writer.writerow(['=== SUMMARY ==='])
-    writer.writerow(['Option', 'Label', 'Count', 'Percentage'])
-    for opt, data in counts.items():
-        pct = f"{data['count'] / total * 100:.1f}%" if total > 0 else '0.0%'
-        writer.writerow([opt, data['label'], data['count'], pct])
-    writer.writerow(['', 'TOTAL', total, ''])
-    writer.writerow([])
-    writer.writerow(['=== DETAIL ==='])
-    writer.writerow(['Timestamp', 'Option'])
-    for v in votes:
-        writer.writerow([v['voted_at'], v['option']])
+    counts, total = db.get_vote_counts_with_total(session_id)
+
+    def generate():
+        writer = csv.writer(_Echo())
+        yield writer.writerow(['Voting System Export'])
+        yield writer.writerow(['Question:', vsession['question']])
+        yield writer.writerow(['Session Start:', vsession['start_time']])
+        yield writer.writerow(['Session End:',   vsession['end_time']])
+        yield writer.writerow([])
+        yield writer.writerow(['=== SUMMARY ==='])
+        yield writer.writerow(['Option', 'Label', 'Count', 'Percentage'])
+        for opt, data in counts.items():
+            yield writer.writerow([opt, data['label'], data['count'], data['pct']])
+        yield writer.writerow(['', 'TOTAL', total, ''])
+        yield writer.writerow([])
+        yield writer.writerow(['=== DETAIL ==='])
+        yield writer.writerow(['Timestamp', 'Option'])
+        for v in db.get_all_votes_for_export(session_id):
+            yield writer.writerow(v)
 
     safe_q   = vsession['question'][:30].replace(' ', '_')
-    filename = f"votes_{safe_q}_{datetime.now().strftime('%Y%m%d')}.csv"
-    output.seek(0)
+    lt       = time.localtime()
+    filename = f"votes_{safe_q}_{lt.tm_year:04d}{lt.tm_mon:02d}{lt.tm_mday:02d}.csv"
     return Response(
-        output.getvalue(),
+        generate(),
         mimetype='text/csv',
         headers={'Content-Disposition': f'attachment; filename="{filename}"'},
     )
@@ -494,7 +594,8 @@ def admin_export_sheets():
     session_id = request.form.get('session_id', type=int)
     if not session_id:
         return jsonify({'success': False, 'error': 'No session selected'})
-    from sheets_sync import sync_to_sheets_blocking
+    if not sync_to_sheets_blocking:
+        return jsonify({'success': False, 'error': 'Sheets sync module not available'})
     result = sync_to_sheets_blocking(session_id)
     return jsonify(result)
 
@@ -578,7 +679,7 @@ def run_setup():
             continue
         break
 
-    hashed = bcrypt.hashpw(pw.encode(), bcrypt.gensalt()).decode()
+    hashed = bcrypt.hashpw(pw.encode(), bcrypt.gensalt(BCRYPT_COST)).decode()
     db.set_admin_password(hashed)
     print("\nAdmin password set.")
     print("\nSetup complete!")
@@ -604,6 +705,7 @@ if __name__ == '__main__':
         sys.exit(1)
 
     db.init_db()  # apply any pending migrations (idempotent)
+    db.start_checkpointer()
 
     from nfc_reader import init_nfc
     init_nfc(socketio)
@@ -19,9 +19,21 @@ else:
     SECRET_KEY = os.environ.get('VOTING_SECRET_KEY', secrets.token_hex(32))
 
 TOKEN_MAX_AGE = 300  # signed vote token lifespan in seconds (5 minutes)
+BCRYPT_COST   = int(os.environ.get('BCRYPT_COST', 10))  # admin password hash work factor
 
 # ── Database ──────────────────────────────────────────────────────────────────
-DATABASE_PATH = os.path.join(BASE_DIR, 'voting.db')
+DATABASE_PATH           = os.path.join(BASE_DIR, 'voting.db')
+DB_POOL_SIZE            = 4                 # idle SQLite connections kept open for reuse across threads
+DB_CACHE_KB             = 8000              # SQLite page cache per connection (PRAGMA cache_size)
+DB_MMAP_BYTES           = 134217728         # memory-mapped read window, 128 MB (PRAGMA mmap_size)
+DB_BUSY_TIMEOUT         = 5000              # ms a writer waits on a locked database (PRAGMA busy_timeout)
+DB_CACHE_TTL            = 2                 # seconds hot read queries are served from memory (cleared on writes)
+DB_ACTIVE_SESSION_TTL   = 60                # upper bound on how long the open-session snapshot is trusted
+WAL_CHECKPOINT_INTERVAL = 300               # seconds between forced WAL checkpoints
+WAL_CHECKPOINT_BYTES    = 16 * 1024 * 1024  # checkpoint early once the -wal file passes this
+
+# ── Admin UI ──────────────────────────────────────────────────────────────────
+ADMIN_PAGE_SIZE = 50  # sessions per page, and per results/export dropdown
 
 # ── NFC / Hardware ────────────────────────────────────────────────────────────
 # Run `i2cdetect -y 1` to confirm. Coolwell PN532 HAT typically uses 0x24.
@@ -30,12 +42,15 @@ SCAN_COOLDOWN   = 2.0  # seconds before the same card UID can trigger again
 RETRY_DELAY     = 5    # seconds to wait before reconnecting after an I2C error
 
 # ── Display timing ────────────────────────────────────────────────────────────
-RESULTS_DISPLAY_SECONDS = 10   # thankyou screen auto-return delay
-ERROR_DISPLAY_SECONDS   = 5    # error overlay auto-hide delay
+RESULTS_DISPLAY_SECONDS = 10    # thankyou screen auto-return delay
+ERROR_DISPLAY_SECONDS   = 5     # error overlay auto-hide delay
+VOTE_UPDATE_INTERVAL    = 0.25  # min seconds between vote_update broadcasts (bursts coalesce)
 
 # ── Logging ───────────────────────────────────────────────────────────────────
 LOG_PATH = os.path.join(BASE_DIR, 'logs', 'app.log')
 
 # ── Google Sheets ─────────────────────────────────────────────────────────────
-CREDENTIALS_PATH     = os.path.join(BASE_DIR, 'credentials', 'google_service_account.json')
-SHEETS_SYNC_DEBOUNCE = 30  # minimum seconds between automatic background syncs
+CREDENTIALS_PATH       = os.path.join(BASE_DIR, 'credentials', 'google_service_account.json')
+SHEETS_SYNC_DEBOUNCE   = 30    # minimum seconds between automatic background syncs
+SHEETS_CHUNK_THRESHOLD = 5000  # Detail rows above which the push is split into chunks
+SHEETS_CHUNK_ROWS      = 2000  # rows per chunked Detail request
@@ -1,131 +1,428 @@
 """
 database.py — SQLite schema and all DB helper functions.
 
-All timestamps are stored and compared in local time using SQLite's
-datetime('now', 'localtime') so school start/end times work correctly
-regardless of the Pi's timezone setting.
-
-WAL mode is enabled so the Sheets sync thread can read while Flask writes.
+All timestamps are stored in local time ('YYYY-MM-DD HH:MM:SS', via
+SQLite's datetime('now', 'localtime')) so school start/end times work
+correctly regardless of the Pi's timezone setting. That form sorts as text,
+so session windows are checked against a bound local "now" and can use an
+index.
+
+WAL mode is enabled so the Sheets sync thread can read while Flask writes;
+synchronous=NORMAL, an in-memory temp store, a larger page cache and mmap
+keep vote writes and results polling off the SD card where possible.
+Connections come from a small shared pool, so the page cache stays warm
+between calls instead of being rebuilt on every connect.
+
+The hot read helpers (sessions, session list, vote counts) are kept
+in a short in-memory TTL cache that every write helper clears. The open
+session is snapshotted until its next start/end edge.
 """
+import inspect
+import itertools
+import logging
+import os
+import queue
 import sqlite3
-from config import DATABASE_PATH
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache, wraps
+
+from config import (
+    DATABASE_PATH, DB_POOL_SIZE, DB_CACHE_TTL, DB_ACTIVE_SESSION_TTL,
+    DB_CACHE_KB, DB_MMAP_BYTES, DB_BUSY_TIMEOUT,
+    WAL_CHECKPOINT_INTERVAL, WAL_CHECKPOINT_BYTES,
+)
+
+logger = logging.getLogger(__name__)
 
 
 # ── Connection ────────────────────────────────────────────────────────────────
 
-def get_db():
-    """Return a connection with WAL mode, foreign keys, and Row factory."""
-    conn = sqlite3.connect(DATABASE_PATH)
-    conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA journal_mode=WAL")
-    conn.execute("PRAGMA foreign_keys=ON")
-    return conn
+_PRAGMAS = f"""
+    PRAGMA journal_mode=WAL;
+    PRAGMA foreign_keys=ON;
+    PRAGMA synchronous=NORMAL;   -- fsync at checkpoints only; safe with WAL
+    PRAGMA temp_store=MEMORY;
+    PRAGMA cache_size=-{DB_CACHE_KB};
+    PRAGMA mmap_size={DB_MMAP_BYTES};
+    PRAGMA busy_timeout={DB_BUSY_TIMEOUT};
+"""
+
+
+class ConnectionPool:
+    """
+    Long-lived SQLite connections shared by the Flask request threads, the
+    NFC reader thread and the Sheets sync thread.
+
+    Idle connections wait in a bounded queue. When it is empty a new
+    connection is opened (PRAGMAs and Row factory applied once); when it is
+    full a returned connection is closed instead, so bursts never block.
+    """
+
+    def __init__(self, path, size):
+        self._path = path
+        self._idle = queue.Queue(maxsize=size)
+
+    def _create_connection(self):
+        # Writes open with BEGIN IMMEDIATE: the write lock is taken (or waited
+        # for, up to busy_timeout) before the first statement, so a vote's two
+        # inserts never stall halfway on a lock upgrade.
+        conn = sqlite3.connect(self._path, check_same_thread=False,
+                               isolation_level='IMMEDIATE')
+        conn.row_factory = sqlite3.Row
+        conn.executescript(_PRAGMAS)
+        return conn
+
+    @contextmanager
+    def get_connection(self):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._create_connection()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()  # never hand on a half-finished transaction
+            try:
+                self._idle.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+
+pool = ConnectionPool(DATABASE_PATH, DB_POOL_SIZE)
+
+
+@contextmanager
+def _connection(conn=None):
+    """Use the caller's connection if one was passed, else borrow from the pool."""
+    if conn is not None:
+        yield conn
+    else:
+        with pool.get_connection() as conn:
+            yield conn
+
+
+@contextmanager
+def read_tx():
+    """
+    Borrow one connection and hold a single read transaction across several
+    queries, so they all see the same snapshot. Pass the yielded connection
+    to helpers as conn=.
+    """
+    with pool.get_connection() as conn:
+        conn.execute("BEGIN DEFERRED")
+        try:
+            yield conn
+        finally:
+            conn.commit()
+
+
+# ── WAL checkpoints ───────────────────────────────────────────────────────────
+
+_WAL_POLL = 30  # seconds between -wal size checks
+
+
+def _checkpoint_loop():
+    wal_path = DATABASE_PATH + '-wal'
+    last     = time.monotonic()
+    # Own connection with no busy wait: a checkpoint that would have to wait
+    # on a reader (e.g. a streaming CSV export) gives up at once and retries
+    # next round, rather than holding votes behind it.
+    conn = sqlite3.connect(DATABASE_PATH, isolation_level=None)
+    conn.execute("PRAGMA busy_timeout=0")
+    while True:
+        time.sleep(_WAL_POLL)
+        try:
+            size = os.path.getsize(wal_path)
+        except OSError:
+            size = 0
+        large = size >= WAL_CHECKPOINT_BYTES
+        if not large and time.monotonic() - last < WAL_CHECKPOINT_INTERVAL:
+            continue
+        last = time.monotonic()
+        # PASSIVE never blocks writers; TRUNCATE (which does) only once the
+        # file has actually grown too big
+        mode = 'TRUNCATE' if large else 'PASSIVE'
+        try:
+            busy, frames, done = conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+            if busy:
+                logger.debug("WAL checkpoint (%s) deferred by a reader (%d/%d frames)",
+                             mode, done, frames)
+        except sqlite3.Error as exc:
+            logger.error("WAL checkpoint failed: %s", exc)
+
+
+def start_checkpointer():
+    """
+    Checkpoint the WAL every WAL_CHECKPOINT_INTERVAL seconds, and truncate it
+    once it passes WAL_CHECKPOINT_BYTES. Long-lived reader threads can
+    otherwise starve SQLite's automatic checkpoints and let the file grow.
+    """
+    threading.Thread(target=_checkpoint_loop, name="WALCheckpoint", daemon=True).start()
+
+
+# ── Read cache ────────────────────────────────────────────────────────────────
+
+_cache      = {}
+_cache_gen  = 0  # bumped on every clear so in-flight reads don't store stale rows
+_cache_lock = threading.Lock()
+_CACHE_MAX  = 256  # public routes take any session id, so keep the dict bounded
+
+
+def _found(value):
+    return value is not None
+
+
+def ttl_cache(seconds, cache_if=_found):
+    """
+    Memoise a read helper's result per bound argument set for `seconds`;
+    positional and keyword calls (and omitted defaults) share one entry.
+    Results failing cache_if (by default None, i.e. "not found") are not
+    stored. Calls that pass an explicit conn= bypass the cache.
+    """
+    def decorator(fn):
+        sig = inspect.signature(fn)
+
+        @wraps(fn)
+        def wrapper(*args, conn=None, **kwargs):
+            if conn is not None:
+                return fn(*args, conn=conn, **kwargs)  # inside read_tx(): stay on its snapshot
+            bound = sig.bind(*args, **kwargs)
+            bound.apply_defaults()
+            bound.arguments.pop('conn', None)
+            key = (fn.__name__, tuple(bound.arguments.items()))
+            with _cache_lock:
+                hit = _cache.get(key)
+                if hit:
+                    if time.monotonic() < hit[0]:
+                        return hit[1]
+                    del _cache[key]
+                gen = _cache_gen
+            value = fn(**bound.arguments)
+            if not cache_if(value):
+                return value
+            with _cache_lock:
+                if gen == _cache_gen:
+                    if len(_cache) >= _CACHE_MAX:
+                        now = time.monotonic()
+                        for k in [k for k, (expires, _) in _cache.items() if expires <= now]:
+                            del _cache[k]
+                        if len(_cache) >= _CACHE_MAX:
+                            _cache.clear()
+                    _cache[key] = (time.monotonic() + seconds, value)
+            return value
+        return wrapper
+    return decorator
+
+
+def _clear_cache(*names):
+    """Drop cached results for the named helpers, or everything if none given."""
+    global _cache_gen, _active_session
+    with _cache_lock:
+        if names:
+            for key in [k for k in _cache if k[0] in names]:
+                del _cache[key]
+        else:
+            _cache.clear()
+            _active_session = (0.0, None)
+        _cache_gen += 1
 
 
 # ── Schema ────────────────────────────────────────────────────────────────────
 
 def init_db():
     """Create all tables and insert default settings rows (idempotent)."""
-    conn = get_db()
-    with conn:
-        conn.executescript("""
-            CREATE TABLE IF NOT EXISTS sessions (
-                id         INTEGER PRIMARY KEY AUTOINCREMENT,
-                question   TEXT    NOT NULL,
-                option_a   TEXT    NOT NULL,
-                option_b   TEXT    NOT NULL,
-                option_c   TEXT,
-                option_d   TEXT,
-                start_time TEXT    NOT NULL,
-                end_time   TEXT    NOT NULL,
-                created_at TEXT    NOT NULL DEFAULT (datetime('now', 'localtime')),
-                is_active  INTEGER NOT NULL DEFAULT 1
-            );
-
-            CREATE TABLE IF NOT EXISTS cards (
-                id          INTEGER PRIMARY KEY AUTOINCREMENT,
-                uid         TEXT    NOT NULL UNIQUE,
-                label       TEXT,
-                enrolled_at TEXT    NOT NULL DEFAULT (datetime('now', 'localtime')),
-                is_active   INTEGER NOT NULL DEFAULT 1
-            );
-
-            CREATE TABLE IF NOT EXISTS votes (
-                id         INTEGER PRIMARY KEY AUTOINCREMENT,
-                session_id INTEGER NOT NULL REFERENCES sessions(id),
-                option     TEXT    NOT NULL,
-                voted_at   TEXT    NOT NULL DEFAULT (datetime('now', 'localtime'))
-            );
-
-            CREATE TABLE IF NOT EXISTS vote_tracker (
-                id         INTEGER PRIMARY KEY AUTOINCREMENT,
-                session_id INTEGER NOT NULL REFERENCES sessions(id),
-                card_uid   TEXT    NOT NULL,
-                option     TEXT,
-                voted_at   TEXT    NOT NULL DEFAULT (datetime('now', 'localtime')),
-                UNIQUE(session_id, card_uid)
-            );
-
-            CREATE TABLE IF NOT EXISTS admin (
-                id            INTEGER PRIMARY KEY,
-                password_hash TEXT NOT NULL
-            );
-
-            CREATE TABLE IF NOT EXISTS settings (
-                key   TEXT PRIMARY KEY,
-                value TEXT
-            );
-
-            INSERT OR IGNORE INTO settings (key, value) VALUES ('sheets_spreadsheet_id', '');
-            INSERT OR IGNORE INTO settings (key, value) VALUES ('sheets_enabled', '0');
-        """)
-        # Migration: add option column to vote_tracker if it doesn't exist yet
-        try:
-            conn.execute("ALTER TABLE vote_tracker ADD COLUMN option TEXT")
-        except Exception:
-            pass  # column already exists
-    conn.close()
+    with pool.get_connection() as conn:
+        with conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS sessions (
+                    id         INTEGER PRIMARY KEY AUTOINCREMENT,
+                    question   TEXT    NOT NULL,
+                    option_a   TEXT    NOT NULL,
+                    option_b   TEXT    NOT NULL,
+                    option_c   TEXT,
+                    option_d   TEXT,
+                    start_time TEXT    NOT NULL,
+                    end_time   TEXT    NOT NULL,
+                    created_at TEXT    NOT NULL DEFAULT (datetime('now', 'localtime')),
+                    is_active  INTEGER NOT NULL DEFAULT 1
+                );
+
+                CREATE TABLE IF NOT EXISTS cards (
+                    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+                    uid         TEXT    NOT NULL UNIQUE,
+                    label       TEXT,
+                    enrolled_at TEXT    NOT NULL DEFAULT (datetime('now', 'localtime')),
+                    is_active   INTEGER NOT NULL DEFAULT 1
+                );
+
+                CREATE TABLE IF NOT EXISTS votes (
+                    id         INTEGER PRIMARY KEY AUTOINCREMENT,
+                    session_id INTEGER NOT NULL REFERENCES sessions(id),
+                    option     TEXT    NOT NULL,
+                    voted_at   TEXT    NOT NULL DEFAULT (datetime('now', 'localtime'))
+                );
+
+                CREATE TABLE IF NOT EXISTS vote_tracker (
+                    id         INTEGER PRIMARY KEY AUTOINCREMENT,
+                    session_id INTEGER NOT NULL REFERENCES sessions(id),
+                    card_uid   TEXT    NOT NULL,
+                    option     TEXT,
+                    voted_at   TEXT    NOT NULL DEFAULT (datetime('now', 'localtime')),
+                    UNIQUE(session_id, card_uid)  -- its index serves card_has_voted
+                );
+
+                CREATE TABLE IF NOT EXISTS admin (
+                    id            INTEGER PRIMARY KEY,
+                    password_hash TEXT NOT NULL
+                );
+
+                CREATE TABLE IF NOT EXISTS settings (
+                    key   TEXT PRIMARY KEY,
+                    value TEXT
+                );
+
+                INSERT OR IGNORE INTO settings (key, value) VALUES ('sheets_spreadsheet_id', '');
+                INSERT OR IGNORE INTO settings (key, value) VALUES ('sheets_enabled', '0');
+
+                -- Tallies and exports filter votes by session; option makes
+                -- the index covering for the per-option counts.
+                CREATE INDEX IF NOT EXISTS idx_votes_session ON votes(session_id, option);
+
+                -- Every tap looks up the session whose window contains now
+                CREATE INDEX IF NOT EXISTS idx_sessions_active_time
+                    ON sessions(is_active, start_time, end_time);
+
+                -- The cards page lists active cards newest first by default
+                CREATE INDEX IF NOT EXISTS idx_cards_active
+                    ON cards(enrolled_at DESC) WHERE is_active=1;
+            """)
+            # Migration: add option column to vote_tracker if it doesn't exist yet
+            try:
+                conn.execute("ALTER TABLE vote_tracker ADD COLUMN option TEXT")
+            except Exception:
+                pass  # column already exists
+            # Migration: session windows are compared as text, so normalise
+            # any older non-canonical timestamps
+            conn.execute("""
+                UPDATE sessions
+                SET start_time = datetime(start_time), end_time = datetime(end_time)
+                WHERE datetime(start_time) IS NOT NULL AND datetime(end_time) IS NOT NULL
+                  AND (start_time <> datetime(start_time) OR end_time <> datetime(end_time))
+            """)
+            conn.execute("ANALYZE")  # refresh planner stats for the indexes above
 
 
 # ── Session helpers ───────────────────────────────────────────────────────────
 
-def get_active_session():
-    """Return the session currently open for voting, or None."""
-    conn = get_db()
+_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+_active_session = (0.0, None)  # (expires_at epoch, session) — see get_active_session
+
+
+def _now(ts=None):
+    """Local time in the stored 'YYYY-MM-DD HH:MM:SS' form, which sorts as text."""
+    return time.strftime(_TIME_FORMAT, time.localtime(ts))
+
+
+def _epoch(stamp, offset=0):
+    """Stored local timestamp → epoch seconds; inf if missing or unparseable."""
     try:
+        return time.mktime(time.strptime(stamp, _TIME_FORMAT)) + offset
+    except (TypeError, ValueError):
+        return float('inf')
+
+
+# One fixed-shape builder per combination of optional options, indexed by
+# (bool(option_c) << 1) | bool(option_d).
+_OPTION_BUILDERS = (
+    lambda s: (('A', s['option_a']), ('B', s['option_b'])),
+    lambda s: (('A', s['option_a']), ('B', s['option_b']), ('D', s['option_d'])),
+    lambda s: (('A', s['option_a']), ('B', s['option_b']), ('C', s['option_c'])),
+    lambda s: (('A', s['option_a']), ('B', s['option_b']), ('C', s['option_c']), ('D', s['option_d'])),
+)
+_OPTION_KEYS = (frozenset('AB'), frozenset('ABD'), frozenset('ABC'), frozenset('ABCD'))
+
+
+def add_session_options(vsession):
+    """
+    Attach the precomputed option list to a session dict (in place):
+      _options      tuple of (key, label) pairs, in display order
+      _option_keys  frozenset of the valid option keys
+    """
+    mask = (bool(vsession['option_c']) << 1) | bool(vsession['option_d'])
+    vsession['_options']     = _OPTION_BUILDERS[mask](vsession)
+    vsession['_option_keys'] = _OPTION_KEYS[mask]
+    return vsession
+
+
+def get_active_session():
+    """
+    Return the session currently open for voting, or None.
+
+    The answer only changes at a session's start or end time (or on an admin
+    edit, which clears it), so it is kept until the next such edge, capped at
+    DB_ACTIVE_SESSION_TTL in case the clock jumps.
+    """
+    global _active_session
+    expires, session = _active_session
+    now = time.time()
+    if now < expires:
+        return session
+
+    with _cache_lock:
+        gen = _cache_gen
+    stamp = _now(now)
+    with pool.get_connection() as conn:
         row = conn.execute("""
             SELECT * FROM sessions
             WHERE is_active = 1
-              AND datetime('now', 'localtime') BETWEEN datetime(start_time)
-                                                   AND datetime(end_time)
+              AND ? BETWEEN start_time AND end_time
             ORDER BY id DESC LIMIT 1
-        """).fetchone()
-        return dict(row) if row else None
-    finally:
-        conn.close()
-
-
-def get_session(session_id):
-    conn = get_db()
-    try:
+        """, (stamp,)).fetchone()
+        if row:
+            session = add_session_options(dict(row))
+            edge    = _epoch(row['end_time'], 1)  # BETWEEN includes the end second
+        else:
+            session = None
+            edge    = _epoch(conn.execute(
+                "SELECT MIN(start_time) FROM sessions WHERE is_active=1 AND start_time > ?",
+                (stamp,),
+            ).fetchone()[0])
+
+    expires = min(now + DB_ACTIVE_SESSION_TTL, edge)
+    with _cache_lock:
+        if gen == _cache_gen:
+            _active_session = (expires, session)
+    return session
+
+
+@ttl_cache(DB_CACHE_TTL)
+def get_session(session_id, conn=None):
+    with _connection(conn) as conn:
         row = conn.execute("SELECT * FROM sessions WHERE id=?", (session_id,)).fetchone()
-        return dict(row) if row else None
-    finally:
-        conn.close()
+        return add_session_options(dict(row)) if row else None
 
 
-def get_all_sessions():
-    conn = get_db()
-    try:
-        rows = conn.execute("SELECT * FROM sessions ORDER BY id DESC").fetchall()
-        return [dict(r) for r in rows]
-    finally:
-        conn.close()
+@ttl_cache(DB_CACHE_TTL)
+def get_all_sessions(limit=-1, offset=0):
+    """
+    Newest first, with only the columns the admin lists show.
+    limit=-1 means no limit (SQLite's own convention).
+    """
+    with pool.get_connection() as conn:
+        rows = conn.execute(
+            "SELECT id, question, start_time, end_time, is_active FROM sessions "
+            "ORDER BY id DESC LIMIT ? OFFSET ?",
+            (limit, offset),
+        ).fetchall()
+        return rows  # sqlite3.Row reads like a dict in templates; no copy needed
 
 
 def create_session(question, option_a, option_b, option_c, option_d, start_time, end_time):
-    conn = get_db()
-    try:
+    with pool.get_connection() as conn:
         with conn:
             conn.execute("UPDATE sessions SET is_active=0")
             cursor = conn.execute(
@@ -134,107 +431,141 @@ def create_session(question, option_a, option_b, option_c, option_d, start_time,
                    VALUES (?,?,?,?,?,?,?)""",
                 (question, option_a, option_b, option_c or None, option_d or None, start_time, end_time),
             )
-            return cursor.lastrowid
-    finally:
-        conn.close()
+    _clear_cache()
+    return cursor.lastrowid
 
 
 def update_session(session_id, question, option_a, option_b, option_c, option_d,
                    start_time, end_time, is_active):
-    conn = get_db()
-    with conn:
-        if is_active:
-            conn.execute("UPDATE sessions SET is_active=0 WHERE id != ?", (session_id,))
-        conn.execute("""
-            UPDATE sessions
-            SET question=?, option_a=?, option_b=?, option_c=?, option_d=?,
-                start_time=?, end_time=?, is_active=?
-            WHERE id=?
-        """, (question, option_a, option_b, option_c or None, option_d or None,
-              start_time, end_time, is_active, session_id))
-    conn.close()
+    with pool.get_connection() as conn:
+        with conn:
+            if is_active:
+                conn.execute("UPDATE sessions SET is_active=0 WHERE id != ?", (session_id,))
+            conn.execute("""
+                UPDATE sessions
+                SET question=?, option_a=?, option_b=?, option_c=?, option_d=?,
+                    start_time=?, end_time=?, is_active=?
+                WHERE id=?
+            """, (question, option_a, option_b, option_c or None, option_d or None,
+                  start_time, end_time, is_active, session_id))
+    _clear_cache()
 
 
 # ── Card helpers ──────────────────────────────────────────────────────────────
 
+# Enrollment changes rarely, so each card's state is memoised for the NFC
+# thread. Writers bump _cards_version instead of clearing: a lookup that
+# raced a write is stored under the old version and never served again.
+_cards_versions = itertools.count(1)  # next() is atomic, unlike += on a global
+_cards_version  = 0
+
+
+@lru_cache(maxsize=512)
+def _card_state(version, uid):
+    """Return (exists, is_active) for a card UID."""
+    with pool.get_connection() as conn:
+        row = conn.execute("SELECT is_active FROM cards WHERE uid=?", (uid,)).fetchone()
+        return (True, bool(row['is_active'])) if row else (False, False)
+
+
+def _cards_changed():
+    global _cards_version
+    _cards_version = next(_cards_versions)
+
+
 def card_is_registered(uid):
     """True if the card exists and is active."""
-    conn = get_db()
-    try:
-        row = conn.execute(
-            "SELECT id FROM cards WHERE uid=? AND is_active=1", (uid,)
-        ).fetchone()
-        return row is not None
-    finally:
-        conn.close()
+    return _card_state(_cards_version, uid)[1]
 
 
 def card_exists(uid):
     """True if the card exists (active or not) — used for enrollment UI."""
-    conn = get_db()
-    try:
-        row = conn.execute("SELECT id FROM cards WHERE uid=?", (uid,)).fetchone()
-        return row is not None
-    finally:
-        conn.close()
+    return _card_state(_cards_version, uid)[0]
 
 
-def get_all_cards():
-    conn = get_db()
-    try:
-        rows = conn.execute("SELECT * FROM cards ORDER BY enrolled_at DESC").fetchall()
-        return [dict(r) for r in rows]
-    finally:
-        conn.close()
+def get_all_cards(include_inactive=False):
+    """Newest first; active cards only unless include_inactive."""
+    with pool.get_connection() as conn:
+        if include_inactive:
+            rows = conn.execute(
+                "SELECT id, uid, label, enrolled_at, is_active FROM cards "
+                "ORDER BY enrolled_at DESC"
+            ).fetchall()
+        else:
+            # Kept as a separate literal so the planner can use idx_cards_active
+            rows = conn.execute(
+                "SELECT id, uid, label, enrolled_at, is_active FROM cards "
+                "WHERE is_active=1 ORDER BY enrolled_at DESC"
+            ).fetchall()
+        return rows
+
+
+def count_active_cards():
+    with pool.get_connection() as conn:
+        return conn.execute("SELECT COUNT(*) FROM cards WHERE is_active=1").fetchone()[0]
 
 
 def enroll_card(uid, label=None):
     """Insert or re-activate a card."""
-    conn = get_db()
-    with conn:
-        conn.execute(
-            "INSERT INTO cards (uid, label, is_active) VALUES (?,?,1) "
-            "ON CONFLICT(uid) DO UPDATE SET label=excluded.label, is_active=1",
-            (uid, label),
-        )
-    conn.close()
+    with pool.get_connection() as conn:
+        with conn:
+            conn.execute(
+                "INSERT INTO cards (uid, label, is_active) VALUES (?,?,1) "
+                "ON CONFLICT(uid) DO UPDATE SET label=excluded.label, is_active=1",
+                (uid, label),
+            )
+    _cards_changed()
+
+
+def bulk_enroll_cards(uids):
+    """
+    Enroll many card UIDs in one transaction; existing cards are left as-is.
+    Returns how many new cards were added.
+    """
+    with pool.get_connection() as conn:
+        with conn:
+            cursor = conn.executemany(
+                "INSERT OR IGNORE INTO cards (uid, is_active) VALUES (?,1)",
+                ((uid,) for uid in uids),
+            )
+    _cards_changed()
+    return cursor.rowcount
 
 
 def deactivate_card(card_id):
-    conn = get_db()
-    with conn:
-        conn.execute("UPDATE cards SET is_active=0 WHERE id=?", (card_id,))
-    conn.close()
+    with pool.get_connection() as conn:
+        with conn:
+            conn.execute("UPDATE cards SET is_active=0 WHERE id=?", (card_id,))
+    _cards_changed()
 
 
 def reactivate_card(card_id):
-    conn = get_db()
-    with conn:
-        conn.execute("UPDATE cards SET is_active=1 WHERE id=?", (card_id,))
-    conn.close()
+    with pool.get_connection() as conn:
+        with conn:
+            conn.execute("UPDATE cards SET is_active=1 WHERE id=?", (card_id,))
+    _cards_changed()
 
 
 def delete_session(session_id):
-    conn = get_db()
-    with conn:
-        conn.execute("DELETE FROM vote_tracker WHERE session_id=?", (session_id,))
-        conn.execute("DELETE FROM votes WHERE session_id=?", (session_id,))
-        conn.execute("DELETE FROM sessions WHERE id=?", (session_id,))
-    conn.close()
+    with pool.get_connection() as conn:
+        with conn:
+            conn.execute("DELETE FROM vote_tracker WHERE session_id=?", (session_id,))
+            conn.execute("DELETE FROM votes WHERE session_id=?", (session_id,))
+            conn.execute("DELETE FROM sessions WHERE id=?", (session_id,))
+    _clear_cache()
 
 
 def reset_votes(session_id):
     """Delete all votes and vote_tracker entries for a session."""
-    conn = get_db()
-    with conn:
-        conn.execute("DELETE FROM votes WHERE session_id=?", (session_id,))
-        conn.execute("DELETE FROM vote_tracker WHERE session_id=?", (session_id,))
-    conn.close()
+    with pool.get_connection() as conn:
+        with conn:
+            conn.execute("DELETE FROM votes WHERE session_id=?", (session_id,))
+            conn.execute("DELETE FROM vote_tracker WHERE session_id=?", (session_id,))
+    _clear_cache()
 
 
 def delete_card(card_id):
-    conn = get_db()
-    try:
+    with pool.get_connection() as conn:
         card = conn.execute("SELECT uid FROM cards WHERE id=?", (card_id,)).fetchone()
         if card:
             uid = card['uid']
@@ -252,22 +583,39 @@ def delete_card(card_id):
                         conn.execute("DELETE FROM votes WHERE id=?", (vote['id'],))
                 conn.execute("DELETE FROM vote_tracker WHERE card_uid=?", (uid,))
                 conn.execute("DELETE FROM cards WHERE id=?", (card_id,))
-    finally:
-        conn.close()
+    _cards_changed()
+    _clear_cache()
 
 
 # ── Vote helpers ──────────────────────────────────────────────────────────────
 
 def card_has_voted(uid, session_id):
-    conn = get_db()
-    try:
+    with pool.get_connection() as conn:
         row = conn.execute(
             "SELECT id FROM vote_tracker WHERE session_id=? AND card_uid=?",
             (session_id, uid),
         ).fetchone()
         return row is not None
-    finally:
-        conn.close()
+
+
+def get_scan_state(uid):
+    """
+    Everything an NFC tap needs to know:
+      session_id   the open session's id, or None if voting is closed
+      exists       the card is enrolled (active or not)
+      registered   the card is enrolled and active
+      voted        the card has already voted in the open session
+    Card state and the open session come from memory; only the voted check
+    reaches SQLite, and only while voting is open.
+    """
+    exists, registered = _card_state(_cards_version, uid)
+    session = get_active_session()
+    return {
+        'session_id': session['id'] if session else None,
+        'exists':     exists,
+        'registered': registered,
+        'voted':      bool(session) and card_has_voted(uid, session['id']),
+    }
 
 
 def record_vote(session_id, card_uid, option):
@@ -275,8 +623,7 @@ def record_vote(session_id, card_uid, option):
     Atomically record a vote.
     Returns True on success, False if the card already voted (race-condition safe).
     """
-    conn = get_db()
-    try:
+    with pool.get_connection() as conn:
         with conn:
             cursor = conn.execute(
                 "INSERT OR IGNORE INTO vote_tracker (session_id, card_uid, option) VALUES (?,?,?)",
@@ -288,103 +635,125 @@ def record_vote(session_id, card_uid, option):
                 "INSERT INTO votes (session_id, option) VALUES (?,?)",
                 (session_id, option),
             )
+        _clear_cache('get_vote_counts_with_total')
         return True
-    finally:
-        conn.close()
 
 
-def get_vote_counts(session_id):
+def _tally(session_id, conn):
+    """
+    One row per session: its option labels, each option's count and the
+    total, aggregated in a single pass over the votes index.
+    """
+    return conn.execute("""
+        SELECT s.option_a, s.option_b, s.option_c, s.option_d,
+               COALESCE(SUM(v.option = 'A'), 0) AS A,
+               COALESCE(SUM(v.option = 'B'), 0) AS B,
+               COALESCE(SUM(v.option = 'C'), 0) AS C,
+               COALESCE(SUM(v.option = 'D'), 0) AS D,
+               COUNT(v.option)                  AS total
+        FROM sessions s LEFT JOIN votes v ON v.session_id = s.id
+        WHERE s.id=?
+        GROUP BY s.id
+    """, (session_id,)).fetchone()
+
+
+def get_vote_counts(session_id, conn=None):
     """
     Return {option: {label, count}} for all options in the session.
     Options with zero votes are included.
     """
-    conn = get_db()
-    try:
-        session = conn.execute(
-            "SELECT * FROM sessions WHERE id=?", (session_id,)
-        ).fetchone()
-        if not session:
-            return {}
-        session = dict(session)
+    return get_vote_counts_with_total(session_id, conn=conn)[0]
 
-        rows = conn.execute(
-            "SELECT option, COUNT(*) as cnt FROM votes WHERE session_id=? GROUP BY option",
-            (session_id,),
-        ).fetchall()
-        counts_raw = {r['option']: r['cnt'] for r in rows}
 
-        options = ['A', 'B']
-        if session['option_c']:
-            options.append('C')
-        if session['option_d']:
-            options.append('D')
-
-        return {
-            opt: {'label': session[f'option_{opt.lower()}'], 'count': counts_raw.get(opt, 0)}
-            for opt in options
+@ttl_cache(DB_CACHE_TTL, cache_if=lambda result: result[0])  # skip unknown sessions
+def get_vote_counts_with_total(session_id, conn=None):
+    """
+    Return ({option: {label, count, pct}}, total) computed in one query.
+    pct is preformatted ('37.5%'); options with zero votes are included.
+    """
+    with _connection(conn) as conn:
+        row = _tally(session_id, conn)
+    if not row:
+        return {}, 0
+    total  = row['total']
+    counts = {}
+    for opt, label in add_session_options(dict(row))['_options']:
+        count = row[opt]
+        counts[opt] = {
+            'label': label,
+            'count': count,
+            'pct':   f"{count / total * 100:.1f}%" if total else '0.0%',
         }
-    finally:
-        conn.close()
+    return counts, total
 
 
 def get_total_votes(session_id):
-    conn = get_db()
-    try:
-        row = conn.execute(
-            "SELECT COUNT(*) as cnt FROM votes WHERE session_id=?", (session_id,)
-        ).fetchone()
-        return row['cnt'] if row else 0
-    finally:
-        conn.close()
+    return get_vote_counts_with_total(session_id)[1]
 
 
-def get_all_votes_for_export(session_id):
-    """Return list of {voted_at, option} dicts — no card UIDs."""
-    conn = get_db()
-    try:
-        rows = conn.execute(
+_EXPORT_BATCH = 1000  # rows pulled from SQLite per fetchmany() during export
+
+
+def get_all_votes_for_export(session_id, conn=None):
+    """
+    Yield (voted_at, option) tuples — no card UIDs.
+    Rows are streamed from the cursor; the connection goes back to the pool
+    once the generator is exhausted or closed.
+    """
+    with _connection(conn) as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = None  # plain tuples go straight to csv / gspread
+        cursor.execute(
             "SELECT voted_at, option FROM votes WHERE session_id=? ORDER BY voted_at",
             (session_id,),
-        ).fetchall()
-        return [dict(r) for r in rows]
-    finally:
-        conn.close()
+        )
+        while True:
+            rows = cursor.fetchmany(_EXPORT_BATCH)
+            if not rows:
+                break
+            yield from rows
 
 
 # ── Settings helpers ──────────────────────────────────────────────────────────
 
-def get_setting(key):
-    conn = get_db()
-    try:
+# Settings change only from the admin page but are read on every vote, so
+# values are kept in memory. set_setting overwrites its entry after commit;
+# readers only fill missing keys, so a slow read never clobbers a newer write.
+_settings      = {}
+_settings_lock = threading.Lock()
+
+
+def get_setting(key, conn=None):
+    with _settings_lock:
+        if key in _settings:
+            return _settings[key]
+    with _connection(conn) as conn:
         row = conn.execute("SELECT value FROM settings WHERE key=?", (key,)).fetchone()
-        return row['value'] if row else None
-    finally:
-        conn.close()
+    value = row['value'] if row else None
+    with _settings_lock:
+        return _settings.setdefault(key, value)
 
 
 def set_setting(key, value):
-    conn = get_db()
-    with conn:
-        conn.execute(
-            "INSERT OR REPLACE INTO settings (key, value) VALUES (?,?)", (key, value)
-        )
-    conn.close()
+    with pool.get_connection() as conn:
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO settings (key, value) VALUES (?,?)", (key, value)
+            )
+    with _settings_lock:
+        _settings[key] = value
 
 
 # ── Admin helpers ─────────────────────────────────────────────────────────────
 
 def set_admin_password(password_hash):
-    conn = get_db()
-    with conn:
-        conn.execute("DELETE FROM admin")
-        conn.execute("INSERT INTO admin (id, password_hash) VALUES (1,?)", (password_hash,))
-    conn.close()
+    with pool.get_connection() as conn:
+        with conn:
+            conn.execute("DELETE FROM admin")
+            conn.execute("INSERT INTO admin (id, password_hash) VALUES (1,?)", (password_hash,))
 
 
 def get_admin_password_hash():
-    conn = get_db()
-    try:
+    with pool.get_connection() as conn:
         row = conn.execute("SELECT password_hash FROM admin WHERE id=1").fetchone()
         return row['password_hash'] if row else None
-    finally:
-        conn.close()
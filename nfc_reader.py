@@ -14,7 +14,9 @@ import threading
 import time
 import logging
 
-from config import NFC_I2C_ADDRESS, SCAN_COOLDOWN, RETRY_DELAY, SECRET_KEY
+from config import NFC_I2C_ADDRESS, SCAN_COOLDOWN, RETRY_DELAY
+from database import get_scan_state
+from tokens import make_token
 
 logger = logging.getLogger(__name__)
 
@@ -75,7 +77,7 @@ class NFCReaderThread(threading.Thread):
             if uid_bytes is None:
                 continue
 
-            uid = ':'.join(f'{b:02X}' for b in uid_bytes)
+            uid = uid_bytes.hex(':').upper()  # e.g. '04:A3:1F:2B'
             now = time.time()
 
             # Suppress double-fire from a single physical tap
@@ -88,23 +90,18 @@ class NFCReaderThread(threading.Thread):
             self._process_scan(uid)
 
     def _process_scan(self, uid):
-        from database import (
-            get_active_session, card_is_registered,
-            card_has_voted, card_exists,
-        )
-        from itsdangerous import URLSafeTimedSerializer
+        state = get_scan_state(uid)
 
         # Always tell the admin enrollment UI about every scan
-        already_enrolled = card_exists(uid)
         _socketio.emit(
             'card_scan_raw',
-            {'uid': uid, 'already_enrolled': already_enrolled},
+            {'uid': uid, 'already_enrolled': state['exists']},
             namespace='/admin',
         )
 
         # Gate 1: is voting open?
-        session = get_active_session()
-        if not session:
+        session_id = state['session_id']
+        if session_id is None:
             _socketio.emit(
                 'card_error',
                 {'message': 'Voting is not open right now.'},
@@ -113,7 +110,7 @@ class NFCReaderThread(threading.Thread):
             return
 
         # Gate 2: is card registered?
-        if not card_is_registered(uid):
+        if not state['registered']:
             _socketio.emit(
                 'card_error',
                 {'message': 'Card not registered. Please see an administrator.'},
@@ -122,7 +119,7 @@ class NFCReaderThread(threading.Thread):
             return
 
         # Gate 3: already voted?
-        if card_has_voted(uid, session['id']):
+        if state['voted']:
             _socketio.emit(
                 'card_error',
                 {'message': 'You have already voted this week!'},
@@ -131,9 +128,7 @@ class NFCReaderThread(threading.Thread):
             return
 
         # All checks passed — issue a short-lived signed token
-        token = URLSafeTimedSerializer(SECRET_KEY).dumps(
-            {'uid': uid, 'session_id': session['id']}
-        )
+        token = make_token({'uid': uid, 'session_id': session_id})
         _socketio.emit(
             'card_valid',
             {'redirect_url': f'/vote/{token}'},
@@ -2,21 +2,30 @@
 sheets_sync.py — Google Sheets integration.
 
 Design decisions:
-  - Fire-and-forget: sync_to_sheets() spawns a daemon thread so it never
-    blocks the vote response path.  SQLite is always the source of truth.
-  - Debounce: automatic syncs are skipped if the last sync was < 30 seconds
-    ago.  The next vote will catch up.  This avoids hitting the Sheets API
-    rate limit (≈60 writes/min) during burst voting.
+  - Fire-and-forget: sync_to_sheets() hands the session to one long-lived
+    worker thread so it never blocks the vote response path.  SQLite is
+    always the source of truth.
+  - Debounce: the worker's queue holds one pending sync, so a burst of votes
+    collapses into a single request, and it waits until 30 seconds have
+    passed since the last sync before running it.  This avoids hitting the
+    Sheets API rate limit (≈60 writes/min) during burst voting, and the
+    last vote of a burst still gets pushed.
   - Manual sync (Admin → Export) always runs immediately, bypassing debounce.
   - Summary tab: Option | Label | Count | Percentage  (cleared + rewritten)
   - Detail tab:  Timestamp | Option  (no card UIDs — privacy-safe)
+  - Both tabs are cleared in one batch request and written in another;
+    Detail rows past SHEETS_CHUNK_THRESHOLD follow as appended chunks.
 """
+import queue
 import threading
 import time
 import logging
 import os
 
-from config import CREDENTIALS_PATH, SHEETS_SYNC_DEBOUNCE
+from config import (
+    CREDENTIALS_PATH, SHEETS_SYNC_DEBOUNCE,
+    SHEETS_CHUNK_THRESHOLD, SHEETS_CHUNK_ROWS,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -25,6 +34,7 @@ _debounce_lock  = threading.Lock()
 
 try:
     import gspread
+    from google.auth.exceptions import RefreshError
     from google.oauth2.service_account import Credentials
     SHEETS_AVAILABLE = True
 except ImportError:
@@ -36,100 +46,170 @@ _SCOPES = [
     'https://www.googleapis.com/auth/drive',
 ]
 
+_TABS = (  # (title, rows, cols) used when a tab has to be created
+    ('Summary', 30,   4),
+    ('Detail',  2000, 2),
+)
+
 
 # ── Public API ────────────────────────────────────────────────────────────────
 
 def sync_to_sheets(session_id):
     """Non-blocking fire-and-forget sync (debounced)."""
-    t = threading.Thread(target=_do_sync, args=(session_id, False), daemon=True)
-    t.start()
+    try:
+        _queue.put_nowait(session_id)
+    except queue.Full:
+        pass  # a sync is already pending and will include this vote
 
 
 def sync_to_sheets_blocking(session_id):
     """Synchronous sync for the Admin → Export button. Returns result dict."""
-    global _last_sync_time
-    with _debounce_lock:
-        _last_sync_time = 0.0  # reset so debounce doesn't skip
-    return _do_sync(session_id, force=True)
+    return _do_sync(session_id)
 
 
 # ── Internal ──────────────────────────────────────────────────────────────────
 
-def _get_client():
-    creds = Credentials.from_service_account_file(CREDENTIALS_PATH, scopes=_SCOPES)
-    return gspread.authorize(creds)
+# The authorised client and opened spreadsheets are kept between syncs; the
+# credentials refresh their own OAuth token, so only a failed refresh forces
+# re-reading the key file.
+_client       = None
+_spreadsheets = {}  # spreadsheet_id → gspread.Spreadsheet
+_client_lock  = threading.Lock()
 
 
-def _do_sync(session_id, force=False):
-    global _last_sync_time
+def _get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            creds   = Credentials.from_service_account_file(CREDENTIALS_PATH, scopes=_SCOPES)
+            _client = gspread.authorize(creds)
+        return _client
 
-    if not SHEETS_AVAILABLE:
-        return {'success': False, 'error': 'gspread library not installed'}
 
-    # Debounce check
-    if not force:
-        with _debounce_lock:
-            now = time.time()
-            if now - _last_sync_time < SHEETS_SYNC_DEBOUNCE:
-                logger.debug("Sheets sync debounced (last sync %.0fs ago)", now - _last_sync_time)
-                return {'success': False, 'error': 'Debounced'}
-            _last_sync_time = now
+def _open_spreadsheet(spreadsheet_id):
+    client = _get_client()
+    with _client_lock:
+        sheet = _spreadsheets.get(spreadsheet_id)
+    if sheet is None:
+        sheet = client.open_by_key(spreadsheet_id)
+        with _client_lock:
+            _spreadsheets[spreadsheet_id] = sheet
+    return sheet
 
-    from database import get_setting, get_session, get_vote_counts, get_all_votes_for_export
 
-    spreadsheet_id = get_setting('sheets_spreadsheet_id') or ''
-    sheets_enabled  = get_setting('sheets_enabled') == '1'
+def _reset_client():
+    global _client
+    with _client_lock:
+        _client = None
+        _spreadsheets.clear()
 
-    if not sheets_enabled:
-        return {'success': False, 'error': 'Sheets sync is disabled in settings'}
-    if not spreadsheet_id:
-        return {'success': False, 'error': 'No Spreadsheet ID configured in settings'}
-    if not os.path.exists(CREDENTIALS_PATH):
-        return {'success': False, 'error': f'Credentials file not found: {CREDENTIALS_PATH}'}
 
-    try:
-        client = _get_client()
-        sheet  = client.open_by_key(spreadsheet_id)
+_queue     = queue.Queue(maxsize=1)  # at most one automatic sync waiting
+_sync_lock = threading.Lock()        # the worker and the Export button never overlap
 
-        session     = get_session(session_id)
-        vote_counts = get_vote_counts(session_id)
-        total       = sum(v['count'] for v in vote_counts.values())
 
-        # ── Summary tab ───────────────────────────────────────────────────────
+def _sync_worker():
+    while True:
+        session_id = _queue.get()
+        with _debounce_lock:
+            wait = _last_sync_time + SHEETS_SYNC_DEBOUNCE - time.time()
+        if wait > 0:
+            logger.debug("Sheets sync debounced for %.0fs", wait)
+            time.sleep(wait)
         try:
-            summary_ws = sheet.worksheet('Summary')
-        except gspread.WorksheetNotFound:
-            summary_ws = sheet.add_worksheet(title='Summary', rows=30, cols=4)
+            session_id = _queue.get_nowait()  # a vote arrived while we waited
+        except queue.Empty:
+            pass
+        _do_sync(session_id)
 
-        summary_ws.clear()
-        summary_ws.update('A1', [['Question', session['question']]])
-        summary_ws.update('A2', [['Option', 'Label', 'Count', 'Percentage']])
 
-        summary_rows = []
-        for opt, data in vote_counts.items():
-            pct = f"{data['count'] / total * 100:.1f}%" if total > 0 else '0.0%'
-            summary_rows.append([opt, data['label'], data['count'], pct])
+def _do_sync(session_id):
+    if not SHEETS_AVAILABLE:
+        return {'success': False, 'error': 'gspread library not installed'}
 
-        if summary_rows:
-            summary_ws.update('A3', summary_rows)
-        summary_ws.update(f'A{3 + len(summary_rows)}', [['', 'TOTAL', total, '']])
+    # The Detail appends aren't idempotent: two syncs interleaving their
+    # clear/write/append steps would duplicate rows. Holding the lock across
+    # the reads too means whichever sync runs second pushes the newer data.
+    with _sync_lock:
+        return _sync_locked(session_id)
 
-        # ── Detail tab ────────────────────────────────────────────────────────
-        try:
-            detail_ws = sheet.worksheet('Detail')
-        except gspread.WorksheetNotFound:
-            detail_ws = sheet.add_worksheet(title='Detail', rows=2000, cols=2)
 
-        detail_ws.clear()
-        detail_ws.update('A1', [['Timestamp', 'Option']])
+def _sync_locked(session_id):
+    global _last_sync_time
+
+    with _debounce_lock:
+        _last_sync_time = time.time()
+
+    from database import (
+        read_tx, get_setting, get_session, get_vote_counts_with_total,
+        get_all_votes_for_export,
+    )
 
-        votes = get_all_votes_for_export(session_id)
-        if votes:
-            detail_ws.update('A2', [[v['voted_at'], v['option']] for v in votes])
+    try:
+        # One connection and one read snapshot, so a vote landing mid-sync
+        # can't make the Summary total and the Detail rows disagree.
+        with read_tx() as conn:
+            spreadsheet_id = get_setting('sheets_spreadsheet_id', conn=conn) or ''
+            sheets_enabled  = get_setting('sheets_enabled', conn=conn) == '1'
+
+            if not sheets_enabled:
+                return {'success': False, 'error': 'Sheets sync is disabled in settings'}
+            if not spreadsheet_id:
+                return {'success': False, 'error': 'No Spreadsheet ID configured in settings'}
+            if not os.path.exists(CREDENTIALS_PATH):
+                return {'success': False, 'error': f'Credentials file not found: {CREDENTIALS_PATH}'}
+
+            session            = get_session(session_id, conn=conn)
+            vote_counts, total = get_vote_counts_with_total(session_id, conn=conn)
+            votes              = list(get_all_votes_for_export(session_id, conn=conn))
+
+        sheet = _open_spreadsheet(spreadsheet_id)
+
+        # One metadata fetch tells us which tabs exist; only missing ones
+        # cost an extra request.
+        titles = {ws.title for ws in sheet.worksheets()}
+        for title, rows, cols in _TABS:
+            if title not in titles:
+                sheet.add_worksheet(title=title, rows=rows, cols=cols)
+
+        summary_rows = [[opt, d['label'], d['count'], d['pct']] for opt, d in vote_counts.items()]
+
+        # Large histories go out in fixed-size chunks so no single request
+        # body (and its JSON encoding) has to hold every vote at once
+        first = SHEETS_CHUNK_ROWS if len(votes) > SHEETS_CHUNK_THRESHOLD else len(votes)
+
+        # Both tabs are cleared in one request and rewritten in another
+        sheet.values_batch_clear(body={'ranges': [title for title, _, _ in _TABS]})
+        sheet.values_batch_update(body={
+            'valueInputOption': 'RAW',
+            'data': [
+                {'range': 'Summary!A1', 'values': [
+                    ['Question', session['question']],
+                    ['Option', 'Label', 'Count', 'Percentage'],
+                    *summary_rows,
+                    ['', 'TOTAL', total, ''],
+                ]},
+                {'range': 'Detail!A1', 'values': [['Timestamp', 'Option'], *votes[:first]]},
+            ],
+        })
+        for start in range(first, len(votes), SHEETS_CHUNK_ROWS):
+            sheet.values_append(
+                'Detail!A1',
+                params={'valueInputOption': 'RAW', 'insertDataOption': 'INSERT_ROWS'},
+                body={'values': votes[start:start + SHEETS_CHUNK_ROWS]},
+            )
 
         logger.info("Sheets sync complete for session %d (%d votes)", session_id, total)
         return {'success': True, 'total': total}
 
+    except RefreshError as exc:
+        _reset_client()  # next sync re-reads the credentials file
+        logger.error("Sheets sync failed, credentials rejected: %s", exc)
+        return {'success': False, 'error': str(exc)}
+
     except Exception as exc:
         logger.error("Sheets sync failed: %s", exc)
         return {'success': False, 'error': str(exc)}
+
+
+threading.Thread(target=_sync_worker, name="SheetsSyncWorker", daemon=True).start()
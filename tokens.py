@@ -0,0 +1,83 @@
+"""
+tokens.py — Short-lived signed vote tokens.
+
+The NFC thread issues a token after a card passes every gate; the vote and
+submit routes verify it. Format (all parts base64url, unpadded):
+
+    <json payload>.<issued-at, 4-byte big-endian>.<HMAC-SHA256 tag, 16 bytes>
+
+The tag covers everything before the last '.', and tokens older than
+TOKEN_MAX_AGE are rejected.
+
+A voter's token is checked twice (opening /vote/<token>, then on submit),
+so successful verifications are remembered until the token expires.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import struct
+import threading
+import time
+
+from config import SECRET_KEY, TOKEN_MAX_AGE
+
+_TAG_SIZE = 16  # truncated SHA-256 tag, 128 bits
+
+# Keyed once at import; each signature copies it rather than re-deriving the
+# HMAC inner/outer pads from SECRET_KEY. The template itself is never updated.
+_SIGNER = hmac.new(SECRET_KEY.encode(), digestmod=hashlib.sha256)
+
+_verified      = {}   # token → (expires_at, payload) for tokens that passed
+_verified_lock = threading.Lock()
+_VERIFIED_MAX  = 256  # a kiosk only has a handful of live tokens at once
+
+
+def _b64encode(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b'=')
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + b'=' * (-len(text) % 4))
+
+
+def _sign(value):
+    mac = _SIGNER.copy()
+    mac.update(value)
+    return mac.digest()[:_TAG_SIZE]
+
+
+def make_token(data):
+    """Sign a JSON-serialisable dict and return a URL-safe token string."""
+    payload = _b64encode(json.dumps(data, separators=(',', ':')).encode())
+    value   = payload + b'.' + _b64encode(struct.pack('>I', int(time.time())))
+    return (value + b'.' + _b64encode(_sign(value))).decode('ascii')
+
+
+def verify_token(token):
+    """Return the token's payload dict, or None if forged, malformed or expired."""
+    hit = _verified.get(token)
+    if hit and time.time() <= hit[0]:
+        return hit[1]
+
+    try:
+        value, tag = token.encode('ascii').rsplit(b'.', 1)
+        payload, issued = value.split(b'.')
+        if not hmac.compare_digest(_b64decode(tag), _sign(value)):
+            return None
+        (timestamp,) = struct.unpack('>I', _b64decode(issued))
+        if not 0 <= time.time() - timestamp <= TOKEN_MAX_AGE:
+            return None
+        data = json.loads(_b64decode(payload))
+    except (ValueError, struct.error):  # includes binascii / JSON / Unicode errors
+        return None
+
+    with _verified_lock:
+        if len(_verified) >= _VERIFIED_MAX:
+            now = time.time()
+            for key in [k for k, (expires, _) in _verified.items() if expires < now]:
+                del _verified[key]
+            if len(_verified) >= _VERIFIED_MAX:
+                _verified.clear()
+        _verified[token] = (timestamp + TOKEN_MAX_AGE, data)
+    return data